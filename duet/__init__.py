@@ -54,5 +54,6 @@ from duet.api import (
     sleep,
     sync,
     timeout_scope,
+    yield_n,
 )
 from duet.futuretools import AwaitableFuture, BufferedFuture, completed_future, failed_future
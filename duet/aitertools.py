@@ -19,6 +19,7 @@ from typing import (
     Deque,
     Generic,
     Iterable,
+    List,
     Optional,
     Tuple,
     TypeVar,
@@ -69,14 +70,16 @@ class AsyncCollector(Generic[T]):
     "consumer"). The producer calls `.add` repeatedly to add values to be
     iterated over, and then calls either `.done` or `.error` to stop the
     iteration or raise an error, respectively. The consumer can use `async for`
-    or direct calls to `__anext__` to iterate over the produced values.
+    or direct calls to `__anext__` to iterate over the produced values. A
+    consumer that can handle values in batches can instead call `.drain`
+    repeatedly to get all values that have been produced so far.
     """
 
     def __init__(self) -> None:
         self._buffer: Deque[T] = collections.deque()
         self._waiter: Optional[futuretools.AwaitableFuture[None]] = None
         self._done: bool = False
-        self._error: Optional[Exception] = None
+        self._error: Optional[BaseException] = None
 
     def add(self, value: T) -> None:
         if self._done:
@@ -92,7 +95,7 @@ class AsyncCollector(Generic[T]):
         if self._waiter:
             self._waiter.try_set_result(None)
 
-    def error(self, error: Exception) -> None:
+    def error(self, error: BaseException) -> None:
         if self._done:
             raise RuntimeError("already done.")
         self._done = True
@@ -103,13 +106,36 @@ class AsyncCollector(Generic[T]):
     def __aiter__(self) -> AsyncIterator[T]:
         return self
 
-    async def __anext__(self) -> T:
+    async def _wait(self) -> None:
         if not self._done and not self._buffer:
             self._waiter = futuretools.AwaitableFuture()
             await self._waiter
             self._waiter = None
+
+    async def __anext__(self) -> T:
+        await self._wait()
         if self._buffer:
             return self._buffer.popleft()
         if self._error:
             raise self._error
         raise StopAsyncIteration()
+
+    async def drain(self) -> List[T]:
+        """Waits for values to be available and returns all of them at once.
+
+        Returns:
+            List of all values added since the last call, in order. This will
+            only be empty once the collector is done and all values have been
+            consumed.
+
+        Raises:
+            The error passed to `.error`, once all prior values are consumed.
+        """
+        await self._wait()
+        if self._buffer:
+            values = list(self._buffer)
+            self._buffer.clear()
+            return values
+        if self._error:
+            raise self._error
+        return []
@@ -0,0 +1,58 @@
+# Copyright 2021 The Duet Authors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import pytest
+
+import duet
+
+
+class Fail(Exception):
+    pass
+
+
+class TestAsyncCollector:
+    @duet.sync
+    async def test_drain_returns_all_buffered_values(self):
+        collector = duet.AsyncCollector[int]()
+        collector.add(1)
+        collector.add(2)
+        assert await collector.drain() == [1, 2]
+        collector.add(3)
+        collector.done()
+        assert await collector.drain() == [3]
+        assert await collector.drain() == []
+
+    @duet.sync
+    async def test_drain_waits_for_values(self):
+        collector = duet.AsyncCollector[int]()
+
+        async def produce():
+            await duet.yield_n()
+            collector.add(1)
+            collector.done()
+
+        async with duet.new_scope() as scope:
+            scope.spawn(produce)
+            assert await collector.drain() == [1]
+            assert await collector.drain() == []
+
+    @duet.sync
+    async def test_drain_raises_error_after_values(self):
+        collector = duet.AsyncCollector[int]()
+        collector.add(1)
+        collector.error(Fail())
+        assert await collector.drain() == [1]
+        with pytest.raises(Fail):
+            await collector.drain()
@@ -16,7 +16,9 @@ import abc
 import collections
 import contextlib
 import functools
+import heapq
 import inspect
+import types
 from concurrent.futures import CancelledError
 from typing import (
     Any,
@@ -25,9 +27,11 @@ from typing import (
     Callable,
     Deque,
     Dict,
+    Iterable,
     List,
     Optional,
     Set,
+    Sized,
     Tuple,
     TypeVar,
 )
@@ -51,11 +55,26 @@ def run(func: Callable[..., Awaitable[T]], *args, **kwds) -> T:
     Returns:
         The final result of the async function.
     """
+    sync_function = _wrapped_sync_function(func)
+    if sync_function is not None:
+        # A plain function wrapped by awaitable_func only needs a scheduler if
+        # it returns something awaitable, so skip scheduler setup otherwise.
+        value = sync_function(*args, **kwds)
+        converter = _awaitable_converter(value)
+        if converter is None:
+            return value
+        return _run_awaitable(converter(value))
+    return _run_awaitable(func(*args, **kwds))
+
+
+def _run_awaitable(awaitable: Awaitable[T]) -> T:
+    """Run an awaitable to completion in a new scheduler."""
     scheduler = impl.Scheduler()
     scheduler.init_signals()
     try:
-        task = scheduler.spawn(func(*args, **kwds))
         try:
+            # Simple functions that never block can finish without any ticks.
+            task = scheduler.spawn_inline(awaitable)
             while scheduler.active_tasks:
                 scheduler.tick()
         except BaseException as exc:
@@ -76,8 +95,7 @@ def sync(f: Callable[..., Awaitable[T]]) -> Callable[..., T]:
     """Decorator that adds a sync version of async function or method."""
     if isinstance(f, classmethod):
         raise TypeError(f"duet.sync cannot be applied to classmethod {f.__func__}")
-    sig = inspect.signature(f)
-    first_arg = next(iter(sig.parameters), None)
+    first_arg = _first_arg_name(f)
 
     if first_arg == "self":
         # For class or instance methods, look up the method to call on the given
@@ -96,10 +114,11 @@ def sync(f: Callable[..., Awaitable[T]]) -> Callable[..., T]:
         # We want the foo_sync wrapper to work the same way. But the wrapper
         # was called with Parent.foo only, so we must look up the appropriate
         # function by name at runtime, using getattr.
+        name = f.__name__
 
         @functools.wraps(f)
         def wrapped(self, *args, **kw):
-            method = getattr(self, f.__name__)
+            method = getattr(self, name)
             if inspect.ismethod(method) and id(method.__func__) == wrapped_id:
                 return run(f, self, *args, **kw)
             return run(method, *args, **kw)
@@ -116,6 +135,19 @@ def sync(f: Callable[..., Awaitable[T]]) -> Callable[..., T]:
     return wrapped
 
 
+def _first_arg_name(f: Callable) -> Optional[str]:
+    """Gets the name of the first positional parameter of f, if any.
+
+    For plain functions we read this directly from the code object, which is
+    much cheaper than building a full signature with inspect.signature.
+    """
+    func = inspect.unwrap(f)
+    if not inspect.isfunction(func):
+        return next(iter(inspect.signature(f).parameters), None)
+    code = func.__code__
+    return code.co_varnames[0] if code.co_argcount else None
+
+
 def awaitable(value):
     """Wraps a value to ensure that it is awaitable."""
     if inspect.isawaitable(value):
@@ -132,7 +164,9 @@ async def _awaitable_value(value):
 def awaitable_func(function):
     """Wraps a function to ensure that it returns an awaitable."""
 
-    if inspect.iscoroutinefunction(function):
+    # Check for our own wrappers first, which is much cheaper than the checks
+    # done by inspect.iscoroutinefunction.
+    if _wrapped_sync_function(function) is not None or inspect.iscoroutinefunction(function):
         return function
 
     if inspect.isgeneratorfunction(function):
@@ -141,13 +175,57 @@ def awaitable_func(function):
             f"async function instead: {function.__name__}"
         )
 
+    # How to make results awaitable depends only on their type (except for
+    # generators, which may or may not be generator-based coroutines), so we
+    # inspect the first result of each type and cache the decision.
+    converters: Dict[type, Optional[Callable[[Any], Awaitable[Any]]]] = {}
+
     @functools.wraps(function)
     async def wrapped(*args, **kw):
-        return await awaitable(function(*args, **kw))
-
+        value = function(*args, **kw)
+        value_type = type(value)
+        try:
+            converter = converters[value_type]
+        except KeyError:
+            converter = _awaitable_converter(value)
+            if value_type is not types.GeneratorType:
+                converters[value_type] = converter
+        if converter is None:
+            return value
+        return await converter(value)
+
+    # Lets run call the plain function directly, without a scheduler.
+    wrapped._duet_sync_function = function
     return wrapped
 
 
+def _wrapped_sync_function(func: Callable) -> Optional[Callable[..., Any]]:
+    """If func was created by awaitable_func, returns the sync function it wraps."""
+    sync_function: Optional[Callable[..., Any]] = getattr(func, "_duet_sync_function", None)
+    # Check __wrapped__ too, since functools.wraps copies our marker attribute
+    # onto any decorator applied on top of an awaitable_func wrapper.
+    wrapped_function: Any = getattr(func, "__wrapped__", None)
+    if sync_function is not None and sync_function is wrapped_function:
+        return sync_function
+    return None
+
+
+def _awaitable_converter(value: Any) -> Optional[Callable[[Any], Awaitable[Any]]]:
+    """Gets a function to make values like this one awaitable.
+
+    Returns None for plain values that can be returned as-is.
+    """
+    if inspect.isawaitable(value):
+        return _identity
+    if AwaitableFuture.isfuture(value):
+        return AwaitableFuture.wrap
+    return None
+
+
+def _identity(value: T) -> T:
+    return value
+
+
 async def pmap_async(
     func: Callable[[T], Awaitable[U]], iterable: AnyIterable[T], limit: Optional[int] = None
 ) -> List[U]:
@@ -161,8 +239,7 @@ async def pmap_async(
     Returns:
         List of results of all function calls.
     """
-    async with new_scope() as scope:
-        return [x async for x in pmap_aiter(scope, func, iterable, limit)]
+    return await _pmap_async(func, iterable, limit, star=False)
 
 
 pmap = sync(pmap_async)
@@ -181,13 +258,39 @@ async def pstarmap_async(
     Returns:
         List of results of all function calls.
     """
-    return await pmap_async(lambda args: func(*args), iterable, limit)
+    return await _pmap_async(func, iterable, limit, star=True)
 
 
 pstarmap = sync(pstarmap_async)
 
 
-async def pmap_aiter(
+async def _pmap_async(
+    func: Callable[..., Awaitable[U]], iterable: AnyIterable[Any], limit: Optional[int], star: bool
+) -> List[U]:
+    """Implementation of pmap_async and pstarmap_async.
+
+    If star is True, each item from iterable is unpacked as args to func.
+    """
+    # Tasks store results directly in the list by index, so unlike pmap_aiter
+    # we never need to reorder them. If we know how many results there will
+    # be, we preallocate the list; otherwise it grows as items are spawned.
+    results: List[Any] = [None] * len(iterable) if isinstance(iterable, Sized) else []
+    limiter = _NoOpLimiter() if limit is None else Limiter(limit)
+    count = 0
+    async with new_scope() as scope:
+        async for i, arg in aenumerate(iterable):
+            release = await limiter._acquire_raw()
+            if i == len(results):
+                results.append(None)
+            scope._spawn_eager(_pmap_store, results, func, star, i, arg, release)
+            count = i + 1
+    # The iterable may yield fewer items than its length promised, e.g. if it
+    # was modified while we iterated, so drop any unused slots.
+    del results[count:]
+    return results
+
+
+def pmap_aiter(
     scope: "Scope",
     func: Callable[[T], Awaitable[U]],
     iterable: AnyIterable[T],
@@ -205,42 +308,7 @@ async def pmap_aiter(
         Asynchronous iterator that yields results in order as they become
         available.
     """
-    collector = AsyncCollector[Tuple[int, U]]()
-
-    async def task(i, arg, slot):
-        try:
-            value = await func(arg)
-            collector.add((i, value))
-        finally:
-            slot.release()
-
-    async def generate():
-        try:
-            limiter = Limiter(limit)
-            async with new_scope() as gen_scope:
-                async for i, arg in aenumerate(iterable):
-                    slot = await limiter.acquire()
-                    gen_scope.spawn(task, i, arg, slot)
-        except BaseException as e:
-            collector.error(e)
-            if isinstance(e, GeneratorExit):
-                # Raise to avoid "coroutine ignored GeneratorExit" errors.
-                raise
-        else:
-            collector.done()
-
-    scope.spawn(generate)
-
-    buffer: Dict[int, U] = {}
-    next_idx = 0
-    async for i, value in collector:
-        buffer[i] = value
-        while next_idx in buffer:
-            yield buffer.pop(next_idx)
-            next_idx += 1
-    while buffer:
-        yield buffer.pop(next_idx)
-        next_idx += 1
+    return _pmap_aiter(scope, func, iterable, limit, star=False)
 
 
 def pstarmap_aiter(
@@ -261,7 +329,95 @@ def pstarmap_aiter(
         Asynchronous iterator that yields results in order as they become
         available.
     """
-    return pmap_aiter(scope, lambda args: func(*args), iterable, limit)
+    return _pmap_aiter(scope, func, iterable, limit, star=True)
+
+
+async def _pmap_aiter(
+    scope: "Scope",
+    func: Callable[..., Awaitable[U]],
+    iterable: AnyIterable[Any],
+    limit: Optional[int],
+    star: bool,
+) -> AsyncIterator[U]:
+    """Implementation of pmap_aiter and pstarmap_aiter.
+
+    If star is True, each item from iterable is unpacked as args to func.
+    """
+    collector = AsyncCollector[Tuple[int, U]]()
+    scope.spawn(_pmap_generate, collector, func, star, iterable, limit)
+
+    # Results may arrive out of order, so we keep them in a min-heap keyed by
+    # index and yield the ready prefix whenever the next expected index arrives.
+    heap: List[Tuple[int, U]] = []
+    next_idx = 0
+    while True:
+        items = await collector.drain()
+        if not items:
+            break
+        for item in items:
+            heapq.heappush(heap, item)
+        while heap and heap[0][0] == next_idx:
+            _, value = heapq.heappop(heap)
+            yield value
+            next_idx += 1
+
+
+async def _pmap_generate(
+    collector: AsyncCollector[Tuple[int, U]],
+    func: Callable[..., Awaitable[U]],
+    star: bool,
+    iterable: AnyIterable[Any],
+    limit: Optional[int],
+) -> None:
+    """Spawns pmap tasks for items in iterable, feeding results to collector."""
+    try:
+        limiter = _NoOpLimiter() if limit is None else Limiter(limit)
+        async with new_scope() as gen_scope:
+            async for i, arg in aenumerate(iterable):
+                release = await limiter._acquire_raw()
+                gen_scope._spawn_eager(_pmap_task, collector, func, star, i, arg, release)
+    except BaseException as e:
+        collector.error(e)
+        if isinstance(e, GeneratorExit):
+            # Raise to avoid "coroutine ignored GeneratorExit" errors.
+            raise
+    else:
+        collector.done()
+
+
+async def _pmap_task(
+    collector: AsyncCollector[Tuple[int, U]],
+    func: Callable[..., Awaitable[U]],
+    star: bool,
+    i: int,
+    arg: Any,
+    release: Callable[[], None],
+) -> None:
+    try:
+        value = await (func(*arg) if star else func(arg))
+        collector.add((i, value))
+    finally:
+        release()
+
+
+async def _pmap_store(
+    results: List[Any],
+    func: Callable[..., Awaitable[U]],
+    star: bool,
+    i: int,
+    arg: Any,
+    release: Callable[[], None],
+) -> None:
+    try:
+        results[i] = await (func(*arg) if star else func(arg))
+    finally:
+        release()
+
+
+async def yield_n(n: int = 1) -> None:
+    """Yields control to the scheduler n times, to let other tasks run."""
+    for _ in range(n):
+        await impl.COMPLETED_FUTURE
 
 
 async def sleep(time: float) -> None:
@@ -324,11 +480,15 @@ async def new_scope(
     tasks: Set[impl.Task] = set()
 
     async def finish_tasks():
-        while True:
+        # Start a deferred task, if any, so that we wait for it below rather
+        # than relying on the main task suspending to start it.
+        scope._spawn_pending()
+        while tasks:
             await impl.any_ready(tasks)
-            tasks.intersection_update(scheduler.active_tasks)
-            if not tasks:
-                break
+            # Tasks normally remove themselves when done, but a task that is
+            # interrupted before it starts never runs its cleanup, so we also
+            # drop done tasks here. This only looks at tasks in this scope.
+            tasks.difference_update([task for task in tasks if task.done])
 
     if timeout is not None:
         if deadline is None:
@@ -340,16 +500,34 @@ async def new_scope(
         main_task.push_deadline(deadline, scope._timeout_error)
     try:
         yield scope
+        # If a single task was spawned and the main task has not suspended
+        # since, nothing could have run concurrently with it anyway, so run it
+        # inline rather than going through the scheduler. The inline task may
+        # itself defer a spawn, so repeat until nothing is pending.
+        pending = scope._take_pending()
+        while pending is not None:
+            func, args, kwds = pending
+            await func(*args, **kwds)
+            pending = scope._take_pending()
         await finish_tasks()
+        if main_task.interrupt_pending:
+            # The scope was interrupted (e.g. by scope.cancel()) but the main
+            # task has not suspended since, so the interrupt has not been
+            # delivered. Yield so that it is raised here, inside the scope,
+            # rather than at some later unrelated await.
+            await impl.COMPLETED_FUTURE
     except BaseException as exc:
+        # Drop a pending task that was never started.
+        scope._take_pending()
         # Interrupt remaining tasks.
-        for task in tasks:
-            if not task.done:
-                task.interrupt(main_task, RuntimeError("scope exited"))
+        remaining = [task for task in tasks if not task.done]
+        for task in remaining:
+            task.interrupt(main_task, RuntimeError("scope exited"))
         # Finish remaining tasks while ignoring further interrupts.
-        main_task.interruptible = False
-        await finish_tasks()
-        main_task.interruptible = True
+        if remaining:
+            main_task.interruptible = False
+            await finish_tasks()
+            main_task.interruptible = True
         # If interrupted, raise the underlying error but suppress the context
         # (the Interrupt itself) when displaying the traceback.
         if isinstance(exc, impl.Interrupt):
@@ -364,6 +542,8 @@ async def new_scope(
 class Scope:
     """Bounds the lifetime of async tasks spawned in the background."""
 
+    __slots__ = ("_main_task", "_scheduler", "_tasks", "_timeout_error", "_pending")
+
     def __init__(
         self, main_task: impl.Task, scheduler: impl.Scheduler, tasks: Set[impl.Task]
     ) -> None:
@@ -371,14 +551,67 @@ class Scope:
         self._scheduler = scheduler
         self._tasks = tasks
         self._timeout_error = TimeoutError()
+        self._pending: Optional[Tuple[Callable[..., Awaitable[Any]], tuple, dict]] = None
 
     def cancel(self) -> None:
         self._main_task.interrupt(self._main_task, CancelledError())
 
     def spawn(self, func: Callable[..., Awaitable[Any]], *args, **kwds) -> None:
         """Starts a background task that will run the given function."""
-        task = self._scheduler.spawn(self._run(func, *args, **kwds), main_task=self._main_task)
-        self._tasks.add(task)
+        if not self._tasks and self._pending is None and impl.current_task() is self._main_task:
+            # Defer starting the task until the main task suspends. If instead
+            # the scope exits first, new_scope will run the task inline.
+            self._pending = (func, args, kwds)
+            self._main_task.call_on_suspend(self._spawn_pending)
+            return
+        self._spawn_pending()
+        self._spawn(func, args, kwds)
+
+    def spawn_many(
+        self, func: Callable[..., Awaitable[Any]], args_iter: Iterable[Iterable[Any]]
+    ) -> None:
+        """Starts a background task running func for each tuple of args.
+
+        This is equivalent to calling spawn(func, *args) for each args in
+        args_iter, but registers all the tasks with the scheduler at once.
+        """
+        self._spawn_pending()
+        tasks = self._scheduler.spawn_batch(
+            [self._run(func, *args) for args in args_iter], main_task=self._main_task
+        )
+        self._tasks.update(tasks)
+
+    def _spawn_eager(self, func: Callable[..., Awaitable[Any]], *args, **kwds) -> None:
+        """Starts a task and runs it immediately until it first suspends.
+
+        If the function raises before suspending, the error propagates to the
+        caller rather than interrupting the main task.
+        """
+        self._spawn_pending()
+        self._spawn(func, args, kwds, eager=True)
+
+    def _spawn(
+        self, func: Callable[..., Awaitable[Any]], args: tuple, kwds: dict, eager: bool = False
+    ) -> None:
+        task = self._scheduler.spawn(
+            self._run(func, *args, **kwds), main_task=self._main_task, eager=eager
+        )
+        if not task.done:
+            self._tasks.add(task)
+
+    def _spawn_pending(self) -> None:
+        pending = self._take_pending()
+        if pending is not None:
+            func, args, kwds = pending
+            self._spawn(func, args, kwds)
+
+    def _take_pending(self) -> Optional[Tuple[Callable[..., Awaitable[Any]], tuple, dict]]:
+        pending = self._pending
+        if pending is not None:
+            self._pending = None
+            # The task no longer needs starting when the main task suspends.
+            self._main_task.remove_suspend_callback(self._spawn_pending)
+        return pending
 
     async def _run(self, func: Callable[..., Awaitable[Any]], *args, **kwds) -> None:
         task = impl.current_task()
@@ -414,7 +647,8 @@ class Limiter:
     def __init__(self, capacity: Optional[int]) -> None:
         self._capacity = capacity
         self._count = 0
-        self._waiters: Deque[AwaitableFuture[None]] = collections.deque()
+        # Created on first contention, since many limiters never need it.
+        self._waiters: Optional[Deque[AwaitableFuture[None]]] = None
         self._available_waiters: List[AwaitableFuture[None]] = []
 
     def is_available(self) -> bool:
@@ -424,37 +658,69 @@ class Limiter:
     async def __aenter__(self) -> None:
         if not self.is_available():
             f = AwaitableFuture[None]()
+            if self._waiters is None:
+                self._waiters = collections.deque()
             self._waiters.append(f)
             try:
                 await f
-            except CancelledError:
-                if not f.cancelled():
-                    # Another _release call set our future, but we were then
-                    # cancelled. Call _release to unblock another waiter, after
-                    # incrementing the count since _release will decrement it.
-                    self._count += 1
+            except BaseException:
+                # We may be interrupted for any reason (cancellation, timeout,
+                # scope exit) after a slot was handed to us. Release it to
+                # unblock another waiter.
+                if f.done() and not f.cancelled():
                     self._release()
                 raise
+            # The slot was handed to us directly, so the count already
+            # includes it.
+            return
         self._count += 1
 
     async def acquire(self) -> "Slot":
         await self.__aenter__()
         return Slot(self._release)
 
+    async def _acquire_raw(self) -> Callable[[], None]:
+        """Like acquire, but returns the release function without a Slot.
+
+        The caller is responsible for calling the release function exactly once.
+        """
+        await self.__aenter__()
+        return self._release
+
     async def __aexit__(self, exc_type, exc, tb) -> None:
         self._release()
 
     def _release(self) -> None:
+        # Hand the slot to the first waiter that has not yet been cancelled,
+        # leaving the count unchanged. If the capacity was reduced below the
+        # count, the slot is given up instead so the count can shrink.
+        waiters = self._waiters
+        if waiters and (self._capacity is None or self._count <= self._capacity):
+            while waiters:
+                if waiters.popleft().try_set_result(None):
+                    return
         self._count -= 1
-        # Release the first waiter that has not yet been cancelled.
-        while self._waiters:
-            f = self._waiters.popleft()
-            if f.try_set_result(None):
-                break
-        if self._available_waiters:
-            for f in self._available_waiters:
-                f.try_set_result(None)
-            self._available_waiters.clear()
+        self._notify_available()
+
+    def _wake_waiters(self) -> None:
+        """Hand free slots to waiters, e.g. after the capacity was increased."""
+        waiters = self._waiters
+        while waiters and self.is_available():
+            if waiters.popleft().try_set_result(None):
+                self._count += 1
+        if self.is_available():
+            self._notify_available()
+
+    def _notify_available(self) -> None:
+        available_waiters = self._available_waiters
+        if available_waiters:
+            if len(available_waiters) == 1:
+                # Common case for a single throttled iterator.
+                available_waiters.pop().try_set_result(None)
+            else:
+                for f in available_waiters:
+                    f.try_set_result(None)
+                available_waiters.clear()
 
     async def available(self) -> None:
         """Wait until this limiter is available (i.e. not full to capacity).
@@ -463,11 +729,11 @@ class Limiter:
         limiter is currently available, to ensure that throttled iterators do
         not race ahead of downstream work.
         """
-        f = AwaitableFuture[None]()
         if self.is_available():
-            f.set_result(None)
-        else:
-            self._available_waiters.append(f)
+            await impl.COMPLETED_FUTURE
+            return
+        f = AwaitableFuture[None]()
+        self._available_waiters.append(f)
         await f
 
     async def throttle(self, iterable: AnyIterable[T]) -> AsyncIterator[T]:
@@ -482,6 +748,45 @@ class Limiter:
     @capacity.setter
     def capacity(self, capacity: int) -> None:
         self._capacity = capacity
+        self._wake_waiters()
+
+
+class _NoOpLimiter(Limiter):
+    """A Limiter with no capacity limit, which skips all bookkeeping.
+
+    Unlike Limiter(None), this cannot be resized later, so it is only used
+    internally where the capacity is known to stay unlimited.
+    """
+
+    def __init__(self) -> None:
+        super().__init__(None)
+
+    def is_available(self) -> bool:
+        return True
+
+    async def __aenter__(self) -> None:
+        pass
+
+    async def __aexit__(self, exc_type, exc, tb) -> None:
+        pass
+
+    async def acquire(self) -> "Slot":
+        return Slot(_noop)
+
+    async def _acquire_raw(self) -> Callable[[], None]:
+        return _noop
+
+    @property
+    def capacity(self) -> Optional[int]:
+        return None
+
+    @capacity.setter
+    def capacity(self, capacity: int) -> None:
+        raise TypeError("cannot resize an unlimited internal limiter")
+
+
+def _noop() -> None:
+    pass
 
 
 class Slot:
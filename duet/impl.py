@@ -30,6 +30,7 @@ from typing import (
     cast,
     Coroutine,
     Generic,
+    Iterable,
     Iterator,
     List,
     Optional,
@@ -42,6 +43,11 @@ import duet.futuretools as futuretools
 T = TypeVar("T")
 
 
+# A completed future that can be shared wherever a future is only used to signal
+# that something is ready. Awaiting or adding callbacks to it has no effect on it.
+COMPLETED_FUTURE = futuretools.completed_future(None)
+
+
 class Interrupt(BaseException):
     def __init__(self, task, error) -> None:
         self.task = task
@@ -67,6 +73,21 @@ LOCALS_TASK_SCHEDULER = "__duet_task_scheduler__"
 
 
 class Task(Generic[T]):
+    __slots__ = (
+        "scheduler",
+        "main_task",
+        "_state",
+        "_future",
+        "_ready_future",
+        "interruptible",
+        "_interrupt",
+        "_result",
+        "_error",
+        "_deadlines",
+        "_suspend_callbacks",
+        "_generator",
+    )
+
     def __init__(
         self, awaitable: Awaitable[T], scheduler: "Scheduler", main_task: Optional["Task"]
     ) -> None:
@@ -74,13 +95,13 @@ class Task(Generic[T]):
         self.main_task = main_task
         self._state = TaskState.WAITING
         self._future: Optional[Future] = None
-        self._ready_future = futuretools.AwaitableFuture[None]()
-        self._ready_future.set_result(None)  # Ready to advance.
+        self._ready_future = COMPLETED_FUTURE  # Ready to advance.
         self.interruptible = True
         self._interrupt: Optional[Interrupt] = None
         self._result: Optional[T] = None
-        self._error: Optional[Exception] = None
+        self._error: Optional[BaseException] = None
         self._deadlines: List[DeadlineEntry] = []
+        self._suspend_callbacks: Optional[List[Callable[[], Any]]] = None
         if main_task and main_task.deadline_entry is not None:
             entry = main_task.deadline_entry
             self.push_deadline(deadline=entry.deadline, timeout_error=entry.timeout_error)
@@ -89,7 +110,7 @@ class Task(Generic[T]):
             awaitable.cr_frame.f_locals.setdefault(LOCALS_TASK_SCHEDULER, scheduler)
 
     def _check_state(self, expected_state: TaskState) -> None:
-        if self._state != expected_state:
+        if self._state is not expected_state:
             raise TaskStateError(self._state, expected_state)
 
     @property
@@ -104,16 +125,23 @@ class Task(Generic[T]):
 
     @property
     def done(self) -> bool:
-        return self._state == TaskState.SUCCEEDED or self._state == TaskState.FAILED
+        return self._state is not TaskState.WAITING
 
     def add_ready_callback(self, callback: Callable[["Task"], Any]) -> None:
         self._check_state(TaskState.WAITING)
         self._ready_future.add_done_callback(lambda _: callback(self))
 
-    def advance(self):
+    def advance(self, raise_errors: bool = False):
+        """Runs the task until it next suspends or finishes.
+
+        Args:
+            raise_errors: If True, an error raised by the task propagates to the
+                caller even if the task has a main task. By default, errors are
+                instead delivered to the main task by interrupting it.
+        """
         if self.done:
             return
-        if self._state == TaskState.WAITING:
+        if self._state is TaskState.WAITING:
             self._ready_future.result()
         token = _current_task.set(self)
         try:
@@ -134,7 +162,7 @@ class Task(Generic[T]):
         except BaseException as error:
             self._error = error
             self._state = TaskState.FAILED
-            if self.main_task:
+            if self.main_task and not raise_errors:
                 self.main_task.interrupt(self, error)
                 return
             else:
@@ -142,15 +170,45 @@ class Task(Generic[T]):
         else:
             if not isinstance(f, Future):
                 f = futuretools.failed_future(TypeError(f"expected Future, got {type(f)}: {f}"))
-            ready_future = futuretools.AwaitableFuture()
-            f.add_done_callback(lambda _: ready_future.try_set_result(None))
+            if f.done():
+                # The task is ready to advance again immediately, e.g. it just
+                # yielded to let other tasks run, so skip the callback setup.
+                ready_future = COMPLETED_FUTURE
+            else:
+                ready_future = futuretools.AwaitableFuture[None]()
+                f.add_done_callback(lambda _: ready_future.try_set_result(None))
             self._future = f
             self._ready_future = ready_future
             self._state = TaskState.WAITING
+            self._run_suspend_callbacks()
         finally:
             _current_task.reset(token)
 
+    def call_on_suspend(self, callback: Callable[[], Any]) -> None:
+        """Registers a callback to run the next time this task suspends.
+
+        The callback is also run before this task's deadline changes, so that
+        any work it does sees the same deadline as when it was registered.
+        """
+        if self._suspend_callbacks is None:
+            self._suspend_callbacks = []
+        self._suspend_callbacks.append(callback)
+
+    def remove_suspend_callback(self, callback: Callable[[], Any]) -> None:
+        """Unregisters a callback from call_on_suspend, if it has not run yet."""
+        callbacks = self._suspend_callbacks
+        if callbacks and callback in callbacks:
+            callbacks.remove(callback)
+
+    def _run_suspend_callbacks(self) -> None:
+        callbacks = self._suspend_callbacks
+        if callbacks:
+            self._suspend_callbacks = None
+            for callback in callbacks:
+                callback()
+
     def push_deadline(self, deadline: float, timeout_error: TimeoutError) -> None:
+        self._run_suspend_callbacks()
         if self._deadlines:
             entry = self._deadlines[-1]
             if entry.deadline < deadline:
@@ -161,6 +219,7 @@ class Task(Generic[T]):
         self._deadlines.append(entry)
 
     def pop_deadline(self) -> None:
+        self._run_suspend_callbacks()
         entry = self._deadlines.pop(-1)
         entry.valid = False
 
@@ -168,6 +227,11 @@ class Task(Generic[T]):
     def deadline_entry(self) -> Optional["DeadlineEntry"]:
         return self._deadlines[-1] if self._deadlines else None
 
+    @property
+    def interrupt_pending(self) -> bool:
+        """Whether this task has an interrupt that has not been delivered yet."""
+        return self._interrupt is not None
+
     def interrupt(self, task, error):
         if self.done or not self.interruptible or self._interrupt:
             return
@@ -209,7 +273,7 @@ def current_scheduler() -> "Scheduler":
 def any_ready(tasks: Set[Task]) -> futuretools.AwaitableFuture[None]:
     """Returns a Future that will fire when any of the given tasks is ready."""
     if not tasks or any(task.done for task in tasks):
-        return futuretools.completed_future(None)
+        return COMPLETED_FUTURE
     f = futuretools.AwaitableFuture[None]()
     for task in tasks:
         task.add_ready_callback(lambda _: f.try_set_result(None))
@@ -230,6 +294,19 @@ class ReadySet:
         self._buffer.add(task.future)
         task.add_ready_callback(self._add)
 
+    def register_new(self, tasks: List[Task]) -> None:
+        """Registers newly-created tasks, which are immediately ready.
+
+        This is equivalent to calling register for each task, but takes the
+        lock only once.
+        """
+        with self._cond:
+            for task in tasks:
+                if task not in self._task_set:
+                    self._task_set.add(task)
+                    self._tasks.append(task)
+            self._cond.notify()
+
     def _add(self, task: Task) -> None:
         """Adds the given task to the ready set, if it is not already there."""
         with self._cond:
@@ -293,6 +370,8 @@ class DeadlineEntry:
             when they elapse.
     """
 
+    __slots__ = ("task", "deadline", "timeout_error", "count", "_cmp_val", "valid")
+
     _counter = itertools.count()
 
     def __init__(self, task: Task, deadline: float, timeout_error: TimeoutError) -> None:
@@ -325,26 +404,89 @@ class Scheduler:
         self._interrupted = False
         self._deadlines: List[DeadlineEntry] = []
 
-    def spawn(self, awaitable: Awaitable[Any], main_task: Optional[Task] = None) -> Task:
+    def spawn(
+        self, awaitable: Awaitable[Any], main_task: Optional[Task] = None, eager: bool = False
+    ) -> Task:
         """Spawns a new Task to run an awaitable in this Scheduler.
 
-        Note that the task will not be advanced until the next scheduler tick.
-        Also, note that this function is safe to call from sync code (such as
-        duet.run) or async code (such as within a scope).
+        Note that unless eager is True, the task will not be advanced until the
+        next scheduler tick. Also, note that this function is safe to call from
+        sync code (such as duet.run) or async code (such as within a scope).
 
         Args:
-            func: The async function to run.
-            *args: Args for func.
-            **kwds: Keyword args for func.
+            awaitable: The awaitable to run.
+            main_task: Task to be interrupted if the new task fails.
+            eager: If True, advance the task immediately until it first
+                suspends. A task that finishes without suspending is never
+                registered with the scheduler, and any error it raises at this
+                point propagates to the caller instead of the main task.
 
         Returns:
             A Task to run the given awaitable.
         """
         task = Task(awaitable, scheduler=self, main_task=main_task)
+        if eager:
+            try:
+                task.advance(raise_errors=True)
+            finally:
+                if task.done:
+                    task.close()
+            if task.done:
+                return task
         self.active_tasks.add(task)
         self._ready_tasks.register(task)
         return task
 
+    def spawn_inline(self, awaitable: Awaitable[Any]) -> Task:
+        """Spawns a new Task and advances it directly for as long as possible.
+
+        The task is advanced without going through tick until it is done or
+        waiting on a future that is not yet done, or until tick is needed to
+        run other tasks, enforce deadlines or handle an interrupt. As with eager
+        spawning, a task that finishes inline is never registered with the
+        scheduler, and any error it raises propagates to the caller.
+
+        Args:
+            awaitable: The awaitable to run.
+
+        Returns:
+            A Task to run the given awaitable.
+        """
+        task = Task(awaitable, scheduler=self, main_task=None)
+        try:
+            while not (self.active_tasks or self._deadlines or self._interrupted):
+                task.advance(raise_errors=True)
+                if task.done or not task._ready_future.done():
+                    break
+        finally:
+            if task.done:
+                task.close()
+        if task.done:
+            return task
+        self.active_tasks.add(task)
+        self._ready_tasks.register(task)
+        return task
+
+    def spawn_batch(
+        self, awaitables: Iterable[Awaitable[Any]], main_task: Optional[Task] = None
+    ) -> List[Task]:
+        """Spawns a new Task for each of the given awaitables.
+
+        This is equivalent to calling spawn for each awaitable, but registers
+        all the new tasks with the scheduler at once.
+
+        Args:
+            awaitables: The awaitables to run.
+            main_task: Task to be interrupted if any of the new tasks fails.
+
+        Returns:
+            A list of Tasks to run the given awaitables, in order.
+        """
+        tasks = [Task(awaitable, scheduler=self, main_task=main_task) for awaitable in awaitables]
+        self.active_tasks.update(tasks)
+        self._ready_tasks.register_new(tasks)
+        return tasks
+
     def time(self) -> float:
         return time.time()
 
@@ -401,15 +543,18 @@ class Scheduler:
                 for entry in self.get_deadline_entries(deadline):
                     entry.task.interrupt(entry.task, entry.timeout_error)
                 ready_tasks = self._ready_tasks.get_all(None)
+        # Bind these outside the loop, which runs once per ready task.
+        discard = self.active_tasks.discard
+        register = self._ready_tasks.register
         for task in ready_tasks:
             try:
                 task.advance()
             finally:
                 if task.done:
                     task.close()
-                    self.active_tasks.discard(task)
+                    discard(task)
                 else:
-                    self._ready_tasks.register(task)
+                    register(task)
 
     def _interrupt(self, signum: int, frame: Optional[Any]) -> None:
         """Interrupt signal handler used while this scheduler is running.
@@ -78,3 +78,60 @@ class TestReadySet:
         tasks = rs.get_all()
         assert tasks == [task2]
         assert not future.flushed
+
+
+class TestScheduler:
+    def test_eager_spawn_of_finished_task_is_not_registered(self):
+        async def func():
+            return 42
+
+        scheduler = impl.Scheduler()
+        task = scheduler.spawn(func(), eager=True)
+        assert task.done
+        assert task.result == 42
+        assert not scheduler.active_tasks
+
+    def test_eager_spawn_of_suspended_task_is_registered(self):
+        future = duet.AwaitableFuture()
+        scheduler = impl.Scheduler()
+        task = scheduler.spawn(future, eager=True)
+        assert not task.done
+        assert task.future is future
+        assert scheduler.active_tasks == {task}
+
+    def test_spawn_batch(self):
+        scheduler = impl.Scheduler()
+        tasks = scheduler.spawn_batch([duet.completed_future(1), duet.completed_future(2)])
+        assert scheduler.active_tasks == set(tasks)
+        while scheduler.active_tasks:
+            scheduler.tick()
+        assert [task.result for task in tasks] == [1, 2]
+
+    def test_spawn_inline_runs_through_completed_futures(self):
+        async def func():
+            a = await duet.completed_future(1)
+            b = await duet.completed_future(2)
+            return a + b
+
+        scheduler = impl.Scheduler()
+        task = scheduler.spawn_inline(func())
+        assert task.done
+        assert task.result == 3
+        assert not scheduler.active_tasks
+
+    def test_spawn_inline_stops_at_pending_future(self):
+        future = duet.AwaitableFuture()
+
+        async def func():
+            await duet.yield_n()
+            return await future
+
+        scheduler = impl.Scheduler()
+        task = scheduler.spawn_inline(func())
+        assert not task.done
+        assert task.future is future
+        assert scheduler.active_tasks == {task}
+        future.set_result(42)
+        while scheduler.active_tasks:
+            scheduler.tick()
+        assert task.result == 42
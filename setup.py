@@ -19,7 +19,7 @@ from setuptools import setup
 
 # This reads the __version__ variable from duet/_version.py
 __version__ = ""
-exec(pathlib.Path("duet/_version.py").read_text())
+exec(compile(pathlib.Path("duet/_version.py").read_text(), "duet/_version.py", "exec"))
 
 name = "duet"
 
@@ -46,9 +46,15 @@ if "DUET_PRE_RELEASE_VERSION" in os.environ:
 # Sanity check
 assert __version__, "Version string cannot be empty"
 
-# Read requirements
-requirements = [line.strip() for line in open("requirements.txt").readlines()]
-dev_requirements = [line.strip() for line in open("dev/requirements.txt").readlines()]
+
+def read_requirements(path: str) -> list:
+    """Reads non-empty lines from a requirements file."""
+    with open(path) as f:
+        return [line.strip() for line in f if line.strip()]
+
+
+requirements = read_requirements("requirements.txt")
+dev_requirements = read_requirements("dev/requirements.txt")
 
 setup(
     name=name,